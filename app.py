@@ -1,42 +1,168 @@
-from flask import Flask, render_template, request, redirect, url_for, session
+from flask import Flask, Response, render_template, request, redirect, url_for, session, current_app, g
+from flask.sessions import SecureCookieSessionInterface
+from flask_compress import Compress
+from flask_limiter import Limiter
+from werkzeug.middleware.proxy_fix import ProxyFix
+from a2wsgi import WSGIMiddleware
+
+try:
+    from openai import (
+        APIConnectionError,
+        APITimeoutError,
+        AsyncOpenAI,
+        InternalServerError,
+        OpenAI,
+        RateLimitError,
+    )
+
+    RETRYABLE_LLM_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+except ImportError:
+    OpenAI = AsyncOpenAI = None
+    RETRYABLE_LLM_ERRORS = ()
+from jinja2 import FileSystemBytecodeCache
 import sqlite3
 from pathlib import Path
-from functools import wraps
+from functools import wraps, lru_cache
+from contextlib import contextmanager
+from collections import deque
+from itertools import islice
+import queue
+import asyncio
+import threading
+import tempfile
+import uuid
+import re
+import types
 import os
-import importlib
 import json
 import secrets
+import hashlib
+import time
+import numpy as np
+import httpx
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 from urllib.parse import urlencode
-from urllib.request import Request, urlopen
 
-app = Flask(__name__)
-app.secret_key = "dev-secret-key"
-DB_PATH = Path(__file__).resolve().parent / "database.db"
+class Blake2bSessionInterface(SecureCookieSessionInterface):
+    digest_method = staticmethod(hashlib.blake2b)
 
 
+app = Flask(__name__)
+app.secret_key = os.environ.get("SECRET_KEY")
+if not app.secret_key:
+    # Each worker would generate its own key, so a session signed by one worker
+    # is rejected by the others and every restart logs everyone out.
+    app.secret_key = secrets.token_urlsafe(48)
+    if not app.debug:
+        app.logger.warning(
+            "SECRET_KEY is not set; using a random per-process key. Sessions will not "
+            "survive restarts or work across workers. Set SECRET_KEY in production."
+        )
+app.session_interface = Blake2bSessionInterface()
+app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
+app.config["SESSION_COOKIE_SECURE"] = os.getenv("SESSION_COOKIE_SECURE", "1").strip() != "0"
+app.config["COMPRESS_MIN_SIZE"] = 500
+app.config["COMPRESS_LEVEL"] = 5
+Compress(app)
+# Render terminates TLS in front of uvicorn; trust its single X-Forwarded-* hop
+# so remote_addr is the client and not the proxy.
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
+RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", "").strip() or "memory://"
+# Only the LLM and OAuth routes are limited; pages and auth forms are not.
+limiter = Limiter(
+    key_func=lambda: str(session.get("user_id") or request.remote_addr),
+    app=app,
+    storage_uri=RATELIMIT_STORAGE_URI,
+)
+if RATELIMIT_STORAGE_URI.startswith("memory://") and not app.debug:
+    app.logger.warning(
+        "RATELIMIT_STORAGE_URI is not set; rate limits are counted per worker process. "
+        "Point it at a shared store such as redis:// to enforce them across workers."
+    )
+
+# Without a directory Jinja uses a per-user 0700 temp dir and refuses to start
+# if someone else owns it, so other local users cannot plant bytecode.
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+if not app.debug:
+    app.config["TEMPLATES_AUTO_RELOAD"] = False
+    app.jinja_env.auto_reload = False
+DB_PATH = Path(os.getenv("DATABASE_PATH") or Path(__file__).resolve().parent / "database.db")
+DB_POOL_SIZE = 8
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "").strip() == "1"
+LLM_EMBEDDING_MODEL = "text-embedding-3-small"
+LLM_MAX_CONCURRENCY = 10
+LLM_TIMEOUT = 30
+CHAT_STREAM_TTL = 86400
+CHAT_STREAM_PENDING_TTL = 300
+CHAT_HISTORY_LIMIT = 16
+LLM_ROUTE_LIMIT = "10/minute;100/hour"
+LLM_ROUTE_LIMIT_THROTTLED = "3/minute;30/hour"
+CHAT_REPEAT_SIMILARITY = 0.95
+BATCH_MAX_ITEMS = 1000
+BATCH_POLL_INTERVAL = 60
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", 16))
+
+
+_POOL = queue.Queue(maxsize=DB_POOL_SIZE)
+_HTTP = httpx.Client(http2=True, timeout=15, limits=httpx.Limits(max_keepalive_connections=16))
+
+
+def _open_connection():
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def init_db_pool():
+    while not _POOL.full():
+        _POOL.put(_open_connection())
+
+
+@contextmanager
 def get_db_connection():
-    return sqlite3.connect(DB_PATH)
+    conn = _POOL.get(timeout=5)
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _POOL.put(conn)
+
+
+GOOGLE_OAUTH_SOURCES = (
+    ("client_id", "GOOGLE_CLIENT_ID", "google_client_id"),
+    ("client_secret", "GOOGLE_CLIENT_SECRET", "google_client_secret"),
+    ("redirect_uri", "GOOGLE_REDIRECT_URI", None),
+)
 
 
 def get_google_oauth_config():
-    client_id = os.getenv("GOOGLE_CLIENT_ID", "").strip() or session.get("google_client_id", "").strip()
-    client_secret = os.getenv("GOOGLE_CLIENT_SECRET", "").strip() or session.get("google_client_secret", "").strip()
-    redirect_uri = os.getenv("GOOGLE_REDIRECT_URI", "").strip()
-    return {
-        "client_id": client_id,
-        "client_secret": client_secret,
-        "redirect_uri": redirect_uri,
-    }
+    cfg = getattr(g, "_g_oauth", None)
+    if cfg is None:
+        cfg = {}
+        for key, env_name, session_key in GOOGLE_OAUTH_SOURCES:
+            value = os.getenv(env_name, "").strip()
+            if not value and session_key:
+                value = session.get(session_key, "").strip()
+            cfg[key] = value
+        g._g_oauth = cfg
+    return cfg
 
 
 def is_google_oauth_configured():
     cfg = get_google_oauth_config()
-    return bool(cfg["client_id"] and cfg["client_secret"])
+    return bool(cfg["client_id"]) and bool(cfg["client_secret"])
 
 
 def google_redirect_uri():
-    cfg = get_google_oauth_config()
-    return cfg["redirect_uri"] or url_for("google_callback", _external=True)
+    redirect_uri = getattr(g, "_g_redirect", None)
+    if redirect_uri is None:
+        redirect_uri = get_google_oauth_config()["redirect_uri"] or url_for("google_callback", _external=True)
+        g._g_redirect = redirect_uri
+    return redirect_uri
 
 
 def login_required(view_func):
@@ -44,60 +170,392 @@ def login_required(view_func):
     def wrapped_view(*args, **kwargs):
         if "user_id" not in session:
             return redirect(url_for("login", error="Please login first."))
-        return view_func(*args, **kwargs)
+        return current_app.ensure_sync(view_func)(*args, **kwargs)
 
     return wrapped_view
 
 
-def call_llm(system_prompt, user_prompt):
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+class LLMCache:
+    def __init__(self, ttl_seconds=86400, similarity_threshold=0.92, candidate_limit=50):
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.candidate_limit = candidate_limit
+
+    @staticmethod
+    def make_key(model, system_prompt, user_prompt):
+        payload = json.dumps({"m": model, "s": system_prompt, "u": user_prompt}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    async def embed_many(client, texts):
+        try:
+            response = await client.embeddings.create(model=LLM_EMBEDDING_MODEL, input=list(texts))
+        except Exception:
+            return None
+        matrix = np.asarray([item.embedding for item in response.data], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        if not norms.all():
+            return None
+        # Stored unit-length, so a dot product is the cosine similarity.
+        return (matrix / norms).astype(np.float16)
+
+    @classmethod
+    async def embed(cls, client, text):
+        matrix = await cls.embed_many(client, [text])
+        return None if matrix is None else matrix[0]
+
+    # A busy pool (queue.Empty) is treated like a miss, so callers always fall
+    # back to a live call and never lose a completion on write.
+    def get_exact(self, key):
+        cutoff = int(time.time()) - self.ttl_seconds
+        try:
+            with get_db_connection() as conn:
+                row = conn.execute(
+                    "SELECT response FROM llm_cache WHERE key = ? AND ts >= ?",
+                    (key, cutoff),
+                ).fetchone()
+        except (sqlite3.Error, queue.Empty):
+            return None
+        return row[0] if row else None
+
+    def get_similar(self, scope, system_prompt, user_prompt, embedding):
+        # Semantic hits are limited to the same user, and the prompts must
+        # carry the same numbers: "Income: 50000" and "Income: 99999" embed
+        # almost identically but need different answers.
+        cutoff = int(time.time()) - self.ttl_seconds
+        try:
+            with get_db_connection() as conn:
+                rows = conn.execute(
+                    "SELECT embedding, response, user FROM llm_cache "
+                    "WHERE scope = ? AND system = ? AND ts >= ? AND embedding IS NOT NULL "
+                    "ORDER BY ts DESC LIMIT ?",
+                    (scope, system_prompt, cutoff, self.candidate_limit),
+                ).fetchall()
+        except (sqlite3.Error, queue.Empty):
+            return None
+
+        numbers = _NUMBER_RE.findall(user_prompt)
+        rows = [
+            row for row in rows
+            if len(row[0]) == embedding.nbytes and _NUMBER_RE.findall(row[2] or "") == numbers
+        ]
+        if not rows:
+            return None
+        matrix = np.stack([np.frombuffer(row[0], dtype=np.float16) for row in rows])
+        scores = matrix.astype(np.float32) @ embedding.astype(np.float32)
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            return rows[best][1]
+        return None
+
+    def set(self, key, system_prompt, user_prompt, embedding, response, scope=None):
+        now = int(time.time())
+        blob = embedding.tobytes() if embedding is not None else None
+        try:
+            with get_db_connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, scope, system, user, embedding, response, ts) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, scope, system_prompt, user_prompt, blob, response, now),
+                )
+                conn.execute("DELETE FROM llm_cache WHERE ts < ?", (now - self.ttl_seconds,))
+                conn.commit()
+        except (sqlite3.Error, queue.Empty):
+            pass
+
+
+llm_cache = LLMCache()
+
+
+@lru_cache(maxsize=4)
+def get_llm_client(api_key):
+    if OpenAI is None:
+        raise RuntimeError("The openai package is not installed.")
+    return OpenAI(api_key=api_key, max_retries=0, timeout=LLM_TIMEOUT)
+
+
+_LLM_LOOP = None
+_LLM_LOOP_LOCK = threading.Lock()
+# Only ever awaited on the LLM loop, so it bounds OpenAI calls for the whole process.
+_LLM_SEMAPHORE = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+
+def _get_llm_loop():
+    global _LLM_LOOP
+    with _LLM_LOOP_LOCK:
+        if _LLM_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+            _LLM_LOOP = loop
+    return _LLM_LOOP
+
+
+def on_llm_loop(func):
+    # Flask runs every async view on a fresh event loop. Decorated coroutines
+    # are handed to one long-lived background loop instead, so the OpenAI
+    # client pool and the semaphore are shared by all requests.
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        future = asyncio.run_coroutine_threadsafe(func(*args, **kwargs), _get_llm_loop())
+        return await asyncio.wrap_future(future)
+
+    return wrapper
+
+
+@lru_cache(maxsize=4)
+def get_async_llm_client(api_key):
+    # Only call this from coroutines wrapped in on_llm_loop: the client's
+    # connection pool is bound to the loop it is first used on.
+    if AsyncOpenAI is None:
+        raise RuntimeError("The openai package is not installed.")
+    return AsyncOpenAI(api_key=api_key, max_retries=0, timeout=LLM_TIMEOUT)
+
+
+llm_retry = retry(
+    stop=stop_after_attempt(4),
+    wait=wait_exponential_jitter(1, 8),
+    retry=retry_if_exception_type(RETRYABLE_LLM_ERRORS),
+    reraise=True,
+)
+
+
+_LLM_RATE_STATE = {"remaining": None, "limit": None}
+
+
+def note_llm_rate_limit(headers):
+    try:
+        remaining = int(headers.get("x-ratelimit-remaining-requests"))
+        limit = int(headers.get("x-ratelimit-limit-requests"))
+    except (TypeError, ValueError):
+        return
+    _LLM_RATE_STATE.update(remaining=remaining, limit=limit)
+
+
+def llm_route_limit():
+    # Tighten per-user limits while the OpenAI request budget is nearly spent.
+    remaining = _LLM_RATE_STATE["remaining"]
+    limit = _LLM_RATE_STATE["limit"]
+    if remaining is not None and limit and remaining < limit * 0.1:
+        return LLM_ROUTE_LIMIT_THROTTLED
+    return LLM_ROUTE_LIMIT
+
+
+@llm_retry
+async def _do_responses(client, model, system_prompt, user_prompt):
+    raw = await client.responses.with_raw_response.create(
+        model=model,
+        input=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+    )
+    note_llm_rate_limit(raw.headers)
+    response = raw.parse()
+    return (getattr(response, "output_text", "") or "").strip()
+
+
+@llm_retry
+async def _do_chat(client, model, system_prompt, user_prompt):
+    raw = await client.chat.completions.with_raw_response.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+    )
+    note_llm_rate_limit(raw.headers)
+    completion = raw.parse()
+    return completion.choices[0].message.content.strip()
+
+
+@llm_retry
+def _open_chat_stream(client, model, system_prompt, user_prompt):
+    # Retries only cover opening the stream; chunks already sent cannot be replayed.
+    raw = client.chat.completions.with_raw_response.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        stream=True,
+    )
+    note_llm_rate_limit(raw.headers)
+    return raw.parse()
+
+
+@on_llm_loop
+async def acall_llm(system_prompt, user_prompt, scope=None):
+    # scope is the user id; without one (e.g. chat) only exact cache hits are served.
     api_key = os.getenv("OPENAI_API_KEY", "").strip()
     if not api_key:
         return None
 
     model = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
     try:
-        openai_module = importlib.import_module("openai")
-        OpenAI = getattr(openai_module, "OpenAI")
-        client = OpenAI(api_key=api_key)
-        try:
-            response = client.responses.create(
-                model=model,
-                input=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-            )
-            text = (getattr(response, "output_text", "") or "").strip()
-            return text or None
-        except Exception:
-            completion = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
+        client = get_async_llm_client(api_key)
+
+        # Cache lookups block on SQLite and the pool; run them in threads so
+        # they never stall the other calls sharing the LLM loop.
+        cache_key = None
+        embedding = None
+        if LLM_CACHE_ENABLED:
+            cache_key = llm_cache.make_key(model, system_prompt, user_prompt)
+            cached = await asyncio.to_thread(llm_cache.get_exact, cache_key)
+            if cached:
+                return cached
+            if scope is not None:
+                embedding = await llm_cache.embed(client, user_prompt)
+            if embedding is not None:
+                cached = await asyncio.to_thread(llm_cache.get_similar, scope, system_prompt, user_prompt, embedding)
+                if cached:
+                    return cached
+
+        async with _LLM_SEMAPHORE:
+            try:
+                text = await _do_responses(client, model, system_prompt, user_prompt)
+            except RETRYABLE_LLM_ERRORS:
+                raise
+            except Exception:
+                # Non-retryable (e.g. model without Responses API support): try Chat Completions.
+                text = await _do_chat(client, model, system_prompt, user_prompt)
+
+        if text and cache_key:
+            await asyncio.to_thread(
+                llm_cache.set, cache_key, system_prompt, user_prompt, embedding, text, scope=scope
             )
-            return completion.choices[0].message.content.strip()
+        return text or None
     except Exception:
         return None
 
 
+# Strips a leading run of "-"/"\u2022" (or "*" followed by whitespace, so "**bold**"
+# survives). The atomic group stops a marker-only line such as "---" from
+# backtracking into an item; it needs Python 3.11+.
+_BULLET_RE = re.compile(r"^[ \t]*(?>\*(?=\s)|[-\u2022]*)[ \t]*(\S.*?)\s*$", re.M)
+
+
 def llm_to_list(text):
-    cleaned = []
-    for line in text.splitlines():
-        item = line.strip().lstrip("-").strip()
-        if item:
-            cleaned.append(item)
-    return cleaned[:12]
+    return [m.group(1) for m in _BULLET_RE.finditer(text)][:12]
+
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a helpful productivity and study assistant. "
+    "Provide practical advice, steps, and concise reasoning. "
+    "Do not claim certainty for uncertain outcomes."
+)
+
 
+def build_chat_context(history):
+    recent = islice(history, max(len(history) - 8, 0), None)
+    # Replies that are still streaming have no content yet; leave them out.
+    return "\n".join([f"{item['role']}: {item['content']}" for item in recent if item["content"]])
 
-def tool_prompt_from_form(config, form_data):
-    lines = [f"Tool: {config['title']}"]
-    for field in config["fields"]:
-        value = form_data.get(field["name"], "").strip()
-        if value:
-            lines.append(f"{field['label']}: {value}")
-    return "\n".join(lines)
+
+def create_chat_stream(stream_id, user_id, message, prompt):
+    # The prompt stays server-side so the stream URL only carries the id.
+    with get_db_connection() as conn:
+        conn.execute(
+            "INSERT INTO chat_streams (id, user_id, message, prompt, ts) VALUES (?, ?, ?, ?, ?)",
+            (stream_id, user_id, message, prompt, int(time.time())),
+        )
+        conn.commit()
+
+
+def claim_chat_stream(stream_id, user_id):
+    # Claimed once, so an EventSource reconnect never spends the quota twice.
+    with get_db_connection() as conn:
+        claimed = conn.execute(
+            "UPDATE chat_streams SET claimed = 1 "
+            "WHERE id = ? AND user_id = ? AND claimed IS NULL AND content IS NULL",
+            (stream_id, user_id),
+        ).rowcount
+        row = conn.execute("SELECT message, prompt FROM chat_streams WHERE id = ?", (stream_id,)).fetchone()
+        conn.commit()
+    return row if claimed else None
+
+
+def save_streamed_reply(stream_id, content):
+    now = int(time.time())
+    with get_db_connection() as conn:
+        conn.execute("UPDATE chat_streams SET content = ?, ts = ? WHERE id = ?", (content, now, stream_id))
+        conn.execute("DELETE FROM chat_streams WHERE ts < ?", (now - CHAT_STREAM_TTL,))
+        conn.commit()
+
+
+def load_chat_history():
+    # Streamed replies finish after the session cookie has been sent, so the
+    # history holds a placeholder turn that is filled in on the next request.
+    history = deque(session.get("ai_chat_history", []), maxlen=CHAT_HISTORY_LIMIT)
+    pending = [item["stream_id"] for item in history if item.get("stream_id")]
+    if not pending:
+        return history
+
+    placeholders = ", ".join("?" for _ in pending)
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            f"SELECT id, content FROM chat_streams WHERE id IN ({placeholders}) AND content IS NOT NULL",
+            pending,
+        ).fetchall()
+    finished = {row["id"]: row["content"] for row in rows}
+
+    # A reply that is still streaming stays as a placeholder; only one whose
+    # stream has not finished within CHAT_STREAM_PENDING_TTL is given up on.
+    cutoff = int(time.time()) - CHAT_STREAM_PENDING_TTL
+    resolved = deque(maxlen=CHAT_HISTORY_LIMIT)
+    for item in history:
+        stream_id = item.get("stream_id")
+        if not stream_id:
+            resolved.append(item)
+        elif stream_id in finished:
+            resolved.append({"role": "assistant", "content": finished[stream_id]})
+        elif item.get("ts", 0) >= cutoff:
+            resolved.append(item)
+    if len(resolved) != len(history) or finished:
+        session["ai_chat_history"] = list(resolved)
+    return resolved
+
+
+@on_llm_loop
+async def find_repeated_chat_reply(history):
+    # Only reuse a reply when the earlier question was asked in the same
+    # context: the user message before it must match the one before the
+    # current message, not counting the earlier question itself. Asking Q and
+    # then rephrasing it as Q' therefore always qualifies.
+    turns = list(history)
+    current = turns[-1]
+    asked = [i for i, item in enumerate(turns[:-1]) if item["role"] == "user"]
+    candidates = []
+    for pos, i in enumerate(asked):
+        reply = turns[i + 1]
+        if reply["role"] != "assistant" or not reply["content"]:
+            continue
+        before_candidate = turns[asked[pos - 1]]["content"] if pos else ""
+        others = asked[:pos] + asked[pos + 1:]
+        before_current = turns[others[-1]]["content"] if others else ""
+        if before_candidate == before_current:
+            candidates.append((turns[i]["content"], reply["content"]))
+    if not candidates:
+        return None
+
+    api_key = os.getenv("OPENAI_API_KEY", "").strip()
+    if not api_key:
+        return None
+    try:
+        client = get_async_llm_client(api_key)
+    except Exception:
+        return None
+
+    vectors = await LLMCache.embed_many(client, [current["content"], *(q for q, _ in candidates)])
+    if vectors is None:
+        return None
+    scores = vectors[1:].astype(np.float32) @ vectors[0].astype(np.float32)
+    best = int(np.argmax(scores))
+    if scores[best] > CHAT_REPEAT_SIMILARITY:
+        return candidates[best][1]
+    return None
 
 
 def fallback_chat_reply(message):
@@ -223,123 +681,375 @@ AI_TOOL_CONFIG = {
     },
 }
 
+# Serialized for client-side hydration before freezing; "<" is escaped so the
+# JSON can sit inside a <script> tag.
+AI_TOOL_CONFIG = types.MappingProxyType({
+    key: types.MappingProxyType({
+        **cfg,
+        "fields": tuple(types.MappingProxyType(field) for field in cfg["fields"]),
+    })
+    for key, cfg in AI_TOOL_CONFIG.items()
+})
+
+
+PROMPT_PREFIX = {key: f"Tool: {cfg['title']}" for key, cfg in AI_TOOL_CONFIG.items()}
+FIELD_NAMES = {}
+FIELD_LABELS = {}
+for _key, _cfg in AI_TOOL_CONFIG.items():
+    FIELD_NAMES[_key], FIELD_LABELS[_key] = zip(*((f["name"], f["label"]) for f in _cfg["fields"]))
+del _key, _cfg
+
+
+def tool_prompt_from_form(tool_key, form_data):
+    values = (
+        (label, form_data.get(name, "").strip())
+        for name, label in zip(FIELD_NAMES[tool_key], FIELD_LABELS[tool_key])
+    )
+    return "\n".join([PROMPT_PREFIX[tool_key], *(f"{label}: {value}" for label, value in values if value)])
 
-def generate_generic_tool_result(tool_key, form_data, mode="advanced"):
-    config = AI_TOOL_CONFIG.get(tool_key)
-    if config:
-        llm_system = (
-            "You are a practical assistant. Return concise, high-value output as short bullet points. "
-            "Avoid hype, do not promise guaranteed outcomes, and include actionable steps."
-        )
-        llm_user = (
-            f"Create a {mode} quality response for this tool request.\n"
-            f"{tool_prompt_from_form(config, form_data)}\n"
-            "Return 8-12 bullet points."
-        )
-        llm_text = call_llm(llm_system, llm_user)
+
+def _field(form_data, key):
+    return form_data.get(key, "").strip()
+
+
+def _fallback_resume_bullets(form_data):
+    role = _field(form_data, "role")
+    task = _field(form_data, "task")
+    impact = _field(form_data, "impact")
+    return [
+        f"Developed and executed {task.lower()} strategies in role as {role}.",
+        f"Collaborated cross-functionally to streamline processes related to {task.lower()}.",
+        f"Drove measurable business value: {impact}.",
+    ]
+
+
+_DAY_TEMPLATE = "Day {day}: {subject} - concept revision + 20 practice questions"
+
+
+# Callers use at most the first 12 items. Bounding the text keeps each lru
+# entry small, since the caches key on the raw form text.
+PARSE_INPUT_LIMIT = 2000
+
+
+def _parse_subjects(text):
+    return _parse_subjects_cached(text[:PARSE_INPUT_LIMIT])
+
+
+def _parse_syllabus(text):
+    return _parse_syllabus_cached(text[:PARSE_INPUT_LIMIT])
+
+
+# Both parsers return tuples so cached results cannot be mutated by callers.
+@lru_cache(maxsize=1024)
+def _parse_subjects_cached(text):
+    return tuple(s.strip() for s in text.split(",") if s.strip())
+
+
+@lru_cache(maxsize=1024)
+def _parse_syllabus_cached(text):
+    return tuple(
+        item.strip(" -\t")
+        for line in text.splitlines()
+        for item in line.split(",")
+        if item.strip()
+    )
+
+
+def _fallback_study_planner(form_data):
+    subjects = _parse_subjects(_field(form_data, "subjects"))
+    hours = _field(form_data, "hours") or "2"
+    exam_date = _field(form_data, "exam_date") or "Not provided"
+    base = [f"Exam Date: {exam_date}", f"Daily Study Hours: {hours}"]
+    base.extend(_DAY_TEMPLATE.format(day=idx, subject=sub) for idx, sub in enumerate(subjects[:5], start=1))
+    return base
+
+
+def _fallback_budget_planner(form_data):
+    income = _field(form_data, "income")
+    rent = _field(form_data, "rent")
+    goal = _field(form_data, "goal")
+    return [
+        f"Income (monthly): {income}",
+        f"Fixed costs: {rent}",
+        f"Savings target: {goal}",
+        "Suggested split: Needs 50%, Wants 30%, Savings/Investments 20%.",
+        "Track expenses weekly and reduce non-essential costs by 10%.",
+    ]
+
+
+def _fallback_meal_planner(form_data):
+    return [
+        f"Goal: {_field(form_data, 'goal')}",
+        f"Diet: {_field(form_data, 'diet')}",
+        f"Restrictions: {_field(form_data, 'restrictions') or 'None'}",
+        "Breakfast: Oats + fruits + protein source",
+        "Lunch: Balanced plate (protein, whole grains, vegetables)",
+        "Dinner: Light meal with lean protein and fiber",
+    ]
+
+
+def _fallback_workout_builder(form_data):
+    days = _field(form_data, "days") or "4"
+    return [
+        f"Goal: {_field(form_data, 'goal')}",
+        f"Level: {_field(form_data, 'level')}",
+        f"Days/Week: {days}",
+        "Plan: Push, Pull, Legs, Core + Cardio",
+        "Progression: Increase load or reps every week.",
+    ]
+
+
+def _fallback_trip_planner(form_data):
+    destination = _field(form_data, "destination")
+    days = _field(form_data, "days") or "3"
+    budget = _field(form_data, "budget")
+    return [
+        f"Destination: {destination}",
+        f"Trip length: {days} days",
+        f"Budget style: {budget}",
+        "Day 1: Local city tour + food market",
+        "Day 2: Landmark visits + cultural activity",
+        "Day 3: Shopping + relaxed departure plan",
+    ]
+
+
+def _fallback_meeting_notes(form_data):
+    notes = _field(form_data, "notes")
+    short = notes[:220]
+    return [
+        "Summary: Team discussed priorities, blockers, and upcoming deadlines.",
+        f"Key context captured: {short}",
+        "Action Items: Assign owners, define due dates, and share status update in next sync.",
+    ]
+
+
+def _fallback_code_explainer(form_data):
+    return [
+        f"Language: {_field(form_data, 'language')}",
+        "High-level: The code takes input, processes it step-by-step, and returns output.",
+        "Key logic: Conditions/loops/functions coordinate to solve the target problem.",
+        "Next step: Add comments and unit tests for maintainability.",
+    ]
+
+
+def _fallback_caption_generator(form_data):
+    topic = _field(form_data, "topic")
+    platform = _field(form_data, "platform")
+    tone = _field(form_data, "tone")
+    return [
+        f"{topic} is here. Big results start today. #{platform.replace(' ', '')} #Growth",
+        f"Built with care and launched with {tone.lower()} energy. Ready to try it? #NewLaunch",
+        f"Small changes, massive outcomes. {topic} for people who want progress. #LevelUp",
+    ]
+
+
+def _fallback_habit_coach(form_data):
+    habit = _field(form_data, "habit")
+    time_slot = _field(form_data, "time_slot")
+    obstacle = _field(form_data, "obstacle")
+    return [
+        f"Habit: {habit}",
+        f"Daily slot: {time_slot}",
+        f"Obstacle plan: If {obstacle.lower()}, then do a 5-minute minimum version.",
+        "Week 1: Build consistency, Week 2: Increase duration, Week 3: Track streak and reward progress.",
+    ]
+
+
+FALLBACKS = {
+    "resume-bullets": _fallback_resume_bullets,
+    "study-planner": _fallback_study_planner,
+    "budget-planner": _fallback_budget_planner,
+    "meal-planner": _fallback_meal_planner,
+    "workout-builder": _fallback_workout_builder,
+    "trip-planner": _fallback_trip_planner,
+    "meeting-notes": _fallback_meeting_notes,
+    "code-explainer": _fallback_code_explainer,
+    "caption-generator": _fallback_caption_generator,
+    "habit-coach": _fallback_habit_coach,
+}
+
+
+TOOL_LLM_SYSTEM_PROMPT = (
+    "You are a practical assistant. Return concise, high-value output as short bullet points. "
+    "Avoid hype, do not promise guaranteed outcomes, and include actionable steps."
+)
+
+
+def tool_llm_prompt(tool_key, form_data, mode):
+    return (
+        f"Create a {mode} quality response for this tool request.\n"
+        f"{tool_prompt_from_form(tool_key, form_data)}\n"
+        "Return 8-12 bullet points."
+    )
+
+
+async def generate_generic_tool_result(tool_key, form_data, mode="advanced", user_id=None):
+    if tool_key in AI_TOOL_CONFIG:
+        llm_user = tool_llm_prompt(tool_key, form_data, mode)
+        llm_text = await acall_llm(TOOL_LLM_SYSTEM_PROMPT, llm_user, scope=user_id)
         if llm_text:
             parsed = llm_to_list(llm_text)
             if parsed:
                 return parsed
 
-    get = lambda key: form_data.get(key, "").strip()
-    if tool_key == "resume-bullets":
-        role = get("role")
-        task = get("task")
-        impact = get("impact")
-        return [
-            f"Developed and executed {task.lower()} strategies in role as {role}.",
-            f"Collaborated cross-functionally to streamline processes related to {task.lower()}.",
-            f"Drove measurable business value: {impact}.",
-        ]
-    if tool_key == "study-planner":
-        subjects = [s.strip() for s in get("subjects").split(",") if s.strip()]
-        hours = get("hours") or "2"
-        exam_date = get("exam_date") or "Not provided"
-        base = [f"Exam Date: {exam_date}", f"Daily Study Hours: {hours}"]
-        for idx, sub in enumerate(subjects[:5], start=1):
-            base.append(f"Day {idx}: {sub} - concept revision + 20 practice questions")
-        return base
-    if tool_key == "budget-planner":
-        income = get("income")
-        rent = get("rent")
-        goal = get("goal")
-        return [
-            f"Income (monthly): {income}",
-            f"Fixed costs: {rent}",
-            f"Savings target: {goal}",
-            "Suggested split: Needs 50%, Wants 30%, Savings/Investments 20%.",
-            "Track expenses weekly and reduce non-essential costs by 10%.",
-        ]
-    if tool_key == "meal-planner":
-        return [
-            f"Goal: {get('goal')}",
-            f"Diet: {get('diet')}",
-            f"Restrictions: {get('restrictions') or 'None'}",
-            "Breakfast: Oats + fruits + protein source",
-            "Lunch: Balanced plate (protein, whole grains, vegetables)",
-            "Dinner: Light meal with lean protein and fiber",
-        ]
-    if tool_key == "workout-builder":
-        days = get("days") or "4"
-        return [
-            f"Goal: {get('goal')}",
-            f"Level: {get('level')}",
-            f"Days/Week: {days}",
-            "Plan: Push, Pull, Legs, Core + Cardio",
-            "Progression: Increase load or reps every week.",
-        ]
-    if tool_key == "trip-planner":
-        destination = get("destination")
-        days = get("days") or "3"
-        budget = get("budget")
-        return [
-            f"Destination: {destination}",
-            f"Trip length: {days} days",
-            f"Budget style: {budget}",
-            "Day 1: Local city tour + food market",
-            "Day 2: Landmark visits + cultural activity",
-            "Day 3: Shopping + relaxed departure plan",
-        ]
-    if tool_key == "meeting-notes":
-        notes = get("notes")
-        short = notes[:220]
-        return [
-            "Summary: Team discussed priorities, blockers, and upcoming deadlines.",
-            f"Key context captured: {short}",
-            "Action Items: Assign owners, define due dates, and share status update in next sync.",
-        ]
-    if tool_key == "code-explainer":
-        return [
-            f"Language: {get('language')}",
-            "High-level: The code takes input, processes it step-by-step, and returns output.",
-            "Key logic: Conditions/loops/functions coordinate to solve the target problem.",
-            "Next step: Add comments and unit tests for maintainability.",
-        ]
-    if tool_key == "caption-generator":
-        topic = get("topic")
-        platform = get("platform")
-        tone = get("tone")
-        return [
-            f"{topic} is here. Big results start today. #{platform.replace(' ', '')} #Growth",
-            f"Built with care and launched with {tone.lower()} energy. Ready to try it? #NewLaunch",
-            f"Small changes, massive outcomes. {topic} for people who want progress. #LevelUp",
-        ]
-    if tool_key == "habit-coach":
-        habit = get("habit")
-        time_slot = get("time_slot")
-        obstacle = get("obstacle")
-        return [
-            f"Habit: {habit}",
-            f"Daily slot: {time_slot}",
-            f"Obstacle plan: If {obstacle.lower()}, then do a 5-minute minimum version.",
-            "Week 1: Build consistency, Week 2: Increase duration, Week 3: Track streak and reward progress.",
-        ]
-    return []
+    fallback = FALLBACKS.get(tool_key)
+    return fallback(form_data) if fallback else []
+
+
+_BATCH_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+_batch_poller = None
+_batch_poller_lock = threading.Lock()
+
+
+def batch_submit(user_id, tool_key, prompts):
+    api_key = os.getenv("OPENAI_API_KEY", "").strip()
+    if not api_key or not prompts:
+        return None
+
+    model = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
+    custom_prompts = {}
+    try:
+        client = get_llm_client(api_key)
+        with tempfile.NamedTemporaryFile(suffix=".jsonl") as batch_file:
+            for system_prompt, user_prompt in prompts:
+                custom_id = uuid.uuid4().hex
+                custom_prompts[custom_id] = [system_prompt, user_prompt]
+                line = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": model,
+                        "messages": [
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt},
+                        ],
+                    },
+                }
+                batch_file.write((json.dumps(line) + "\n").encode("utf-8"))
+            batch_file.flush()
+            batch_file.seek(0)
+            uploaded = client.files.create(file=batch_file, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+    except Exception:
+        return None
+
+    with get_db_connection() as conn:
+        conn.execute(
+            "INSERT INTO batch_jobs (user_id, tool_key, batch_id, model, prompts, status, ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, tool_key, batch.id, model, json.dumps(custom_prompts), batch.status, int(time.time())),
+        )
+        conn.commit()
+
+    start_batch_poller()
+    return batch.id
+
+
+def _store_batch_output(client, job, output_file_id):
+    prompts = json.loads(job["prompts"])
+    results = {}
+    output = client.files.content(output_file_id).text
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        # One malformed line must not keep the whole job pending forever.
+        try:
+            item = json.loads(line)
+            response = item.get("response") or {}
+            custom_id = item.get("custom_id")
+            prompt = prompts.get(custom_id)
+            if not prompt or response.get("status_code") != 200:
+                continue
+            text = (response["body"]["choices"][0]["message"]["content"] or "").strip()
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+            continue
+        if text:
+            results[custom_id] = text
+            system_prompt, user_prompt = prompt
+            key = llm_cache.make_key(job["model"], system_prompt, user_prompt)
+            llm_cache.set(key, system_prompt, user_prompt, None, text, scope=job["user_id"])
+    return results
+
+
+def poll_batch_jobs():
+    global _batch_poller
+    with _batch_poller_lock:
+        _batch_poller = None
+
+    api_key = os.getenv("OPENAI_API_KEY", "").strip()
+    if not api_key:
+        return
+
+    placeholders = ", ".join("?" for _ in _BATCH_TERMINAL_STATUSES)
+    with get_db_connection() as conn:
+        jobs = conn.execute(
+            f"SELECT id, user_id, batch_id, model, prompts FROM batch_jobs WHERE status NOT IN ({placeholders})",
+            _BATCH_TERMINAL_STATUSES,
+        ).fetchall()
+    if not jobs:
+        return
+
+    client = get_llm_client(api_key)
+    pending = 0
+    for job in jobs:
+        # Every worker runs its own poller; the lease makes sure only one of
+        # them checks a job per interval and downloads its output.
+        now = int(time.time())
+        with get_db_connection() as conn:
+            claimed = conn.execute(
+                "UPDATE batch_jobs SET claimed_at = ? WHERE id = ? "
+                "AND (claimed_at IS NULL OR claimed_at <= ?)",
+                (now, job["id"], now - BATCH_POLL_INTERVAL),
+            ).rowcount
+            conn.commit()
+        if not claimed:
+            pending += 1
+            continue
+
+        results = None
+        try:
+            batch = client.batches.retrieve(job["batch_id"])
+            if batch.status == "completed" and batch.output_file_id:
+                results = _store_batch_output(client, job, batch.output_file_id)
+        except Exception:
+            pending += 1
+            continue
+
+        with get_db_connection() as conn:
+            conn.execute(
+                "UPDATE batch_jobs SET status = ?, results = ? WHERE id = ?",
+                (batch.status, json.dumps(results) if results is not None else None, job["id"]),
+            )
+            conn.commit()
+        if batch.status not in _BATCH_TERMINAL_STATUSES:
+            pending += 1
+
+    if pending:
+        start_batch_poller()
+
+
+def start_batch_poller():
+    global _batch_poller
+    with _batch_poller_lock:
+        if _batch_poller is None:
+            _batch_poller = threading.Timer(BATCH_POLL_INTERVAL, poll_batch_jobs)
+            _batch_poller.daemon = True
+            _batch_poller.start()
+
+# Set by init_db once the unique indexes that the ON CONFLICT upserts rely on exist.
+USERS_UPSERT = False
+
 
 # Create database table
 def init_db():
-    with get_db_connection() as conn:
+    conn = _open_connection()
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
         cursor = conn.cursor()
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS users (
@@ -354,10 +1064,87 @@ def init_db():
         cols = [row[1] for row in cursor.fetchall()]
         if "google_id" not in cols:
             cursor.execute("ALTER TABLE users ADD COLUMN google_id TEXT")
+        cursor.execute("UPDATE users SET google_id = NULL WHERE google_id = ''")
+        # Older databases allowed duplicate sign-ups. Those accounts need a
+        # reviewed merge, so leave them alone and skip the index instead.
+        for column in ("email", "google_id"):
+            cursor.execute(
+                f"SELECT {column} FROM users WHERE {column} IS NOT NULL "
+                f"GROUP BY {column} HAVING COUNT(*) > 1"
+            )
+            duplicates = [row[0] for row in cursor.fetchall()]
+            if duplicates:
+                app.logger.warning(
+                    "Not creating unique index on users.%s; duplicate values: %s",
+                    column,
+                    ", ".join(duplicates),
+                )
+                continue
+            cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS users_{column}_idx ON users ({column})")
+        cursor.execute("PRAGMA index_list(users)")
+        indexes = {row[1] for row in cursor.fetchall()}
+        global USERS_UPSERT
+        USERS_UPSERT = {"users_email_idx", "users_google_id_idx"} <= indexes
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                scope INTEGER,
+                system TEXT,
+                user TEXT,
+                embedding BLOB,
+                response TEXT,
+                ts INTEGER
+            )
+        """)
+        cursor.execute("PRAGMA table_info(llm_cache)")
+        if "scope" not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE llm_cache ADD COLUMN scope INTEGER")
+        cursor.execute("DROP INDEX IF EXISTS llm_cache_system_ts_idx")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_scope_system_ts_idx ON llm_cache (scope, system, ts)"
+        )
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_streams (
+                id TEXT PRIMARY KEY,
+                content TEXT,
+                ts INTEGER,
+                user_id INTEGER,
+                message TEXT,
+                prompt TEXT,
+                claimed INTEGER
+            )
+        """)
+        cursor.execute("PRAGMA table_info(chat_streams)")
+        stream_cols = [row[1] for row in cursor.fetchall()]
+        for column, ddl in (("user_id", "INTEGER"), ("message", "TEXT"), ("prompt", "TEXT"), ("claimed", "INTEGER")):
+            if column not in stream_cols:
+                cursor.execute(f"ALTER TABLE chat_streams ADD COLUMN {column} {ddl}")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS batch_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                tool_key TEXT,
+                batch_id TEXT,
+                model TEXT,
+                prompts TEXT,
+                status TEXT,
+                ts INTEGER,
+                results TEXT,
+                claimed_at INTEGER
+            )
+        """)
+        cursor.execute("PRAGMA table_info(batch_jobs)")
+        batch_cols = [row[1] for row in cursor.fetchall()]
+        for column, ddl in (("results", "TEXT"), ("claimed_at", "INTEGER")):
+            if column not in batch_cols:
+                cursor.execute(f"ALTER TABLE batch_jobs ADD COLUMN {column} {ddl}")
         conn.commit()
-
-init_db()
-
+    finally:
+        conn.close()
+
+init_db()
+init_db_pool()
+
 @app.route("/")
 def home():
     return render_template("index.html")
@@ -369,7 +1156,7 @@ def get_started():
 @app.route("/index.html")
 def home_alias():
     return redirect(url_for("home"))
-
+
 @app.route("/features")
 def features():
     return render_template("features.html")
@@ -377,7 +1164,7 @@ def features():
 @app.route("/features.html")
 def features_alias():
     return redirect(url_for("features"))
-
+
 @app.route("/pricing")
 def pricing():
     return render_template("pricing.html")
@@ -385,7 +1172,7 @@ def pricing():
 @app.route("/pricing.html")
 def pricing_alias():
     return redirect(url_for("pricing"))
-
+
 @app.route("/signup")
 def signup():
     return render_template("signup.html")
@@ -431,6 +1218,7 @@ def login_alias():
 
 
 @app.route("/auth/google/start")
+@limiter.limit("10/minute")
 def google_start():
     cfg = get_google_oauth_config()
     if not is_google_oauth_configured():
@@ -450,6 +1238,42 @@ def google_start():
     return redirect(f"https://accounts.google.com/o/oauth2/v2/auth?{urlencode(params)}")
 
 
+def upsert_google_user(conn, name, email, google_id):
+    cursor = conn.cursor()
+    if USERS_UPSERT:
+        cursor.execute(
+            "INSERT INTO users (name, email, password, google_id) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (google_id) DO UPDATE SET name = excluded.name, email = excluded.email "
+            "ON CONFLICT (email) DO UPDATE SET name = excluded.name, google_id = excluded.google_id "
+            "RETURNING id",
+            (name, email, "", google_id),
+        )
+        user_id = cursor.fetchone()[0]
+        conn.commit()
+        return user_id
+
+    # Without the unique indexes ON CONFLICT has no target; look the user up first.
+    cursor.execute(
+        "SELECT id FROM users WHERE google_id = ? OR email = ? ORDER BY google_id = ? DESC, id LIMIT 1",
+        (google_id, email, google_id),
+    )
+    user = cursor.fetchone()
+    if user:
+        user_id = user[0]
+        cursor.execute(
+            "UPDATE users SET name = ?, email = ?, google_id = ? WHERE id = ?",
+            (name, email, google_id, user_id),
+        )
+    else:
+        cursor.execute(
+            "INSERT INTO users (name, email, password, google_id) VALUES (?, ?, ?, ?)",
+            (name, email, "", google_id),
+        )
+        user_id = cursor.lastrowid
+    conn.commit()
+    return user_id
+
+
 @app.route("/auth/google/callback")
 def google_callback():
     if request.args.get("error"):
@@ -464,67 +1288,43 @@ def google_callback():
     if not code:
         return redirect(url_for("login", error="Missing Google authorization code."))
 
-    token_data = urlencode(
-        {
-            "code": code,
-            "client_id": get_google_oauth_config()["client_id"],
-            "client_secret": get_google_oauth_config()["client_secret"],
-            "redirect_uri": google_redirect_uri(),
-            "grant_type": "authorization_code",
-        }
-    ).encode("utf-8")
+    cfg = get_google_oauth_config()
+    token_fields = {
+        "code": code,
+        "client_id": cfg["client_id"],
+        "client_secret": cfg["client_secret"],
+        "redirect_uri": google_redirect_uri(),
+        "grant_type": "authorization_code",
+    }
 
     try:
-        token_req = Request(
-            "https://oauth2.googleapis.com/token",
-            data=token_data,
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            method="POST",
-        )
-        with urlopen(token_req, timeout=15) as resp:
-            token_json = json.loads(resp.read().decode("utf-8"))
-        access_token = token_json.get("access_token", "")
+        token_resp = _HTTP.post("https://oauth2.googleapis.com/token", data=token_fields)
+        token_resp.raise_for_status()
+        access_token = token_resp.json().get("access_token", "")
         if not access_token:
             return redirect(url_for("login", error="Google token exchange failed."))
 
-        profile_req = Request(
+        profile_resp = _HTTP.get(
             "https://www.googleapis.com/oauth2/v3/userinfo",
             headers={"Authorization": f"Bearer {access_token}"},
-            method="GET",
         )
-        with urlopen(profile_req, timeout=15) as resp:
-            profile = json.loads(resp.read().decode("utf-8"))
+        profile_resp.raise_for_status()
+        profile = profile_resp.json()
     except Exception:
         return redirect(url_for("login", error="Could not complete Google login."))
 
-    google_id = (profile.get("sub") or "").strip()
+    google_id = (profile.get("sub") or "").strip() or None
     email = (profile.get("email") or "").strip()
     name = (profile.get("name") or "Google User").strip()
     if not email:
         return redirect(url_for("login", error="Google account email was not provided."))
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, name, email FROM users WHERE google_id = ? OR email = ? LIMIT 1",
-            (google_id, email),
-        )
-        user = cursor.fetchone()
-
-        if user:
-            user_id = user[0]
-            cursor.execute(
-                "UPDATE users SET name = ?, email = ?, google_id = ? WHERE id = ?",
-                (name, email, google_id, user_id),
-            )
-            conn.commit()
-        else:
-            cursor.execute(
-                "INSERT INTO users (name, email, password, google_id) VALUES (?, ?, ?, ?)",
-                (name, email, "", google_id),
-            )
-            conn.commit()
-            user_id = cursor.lastrowid
+    try:
+        with get_db_connection() as conn:
+            user_id = upsert_google_user(conn, name, email, google_id)
+    except sqlite3.IntegrityError:
+        # The Google account is linked to one user and its email belongs to another.
+        return redirect(url_for("login", error="This Google account's email is already used by another account."))
 
     session["user_id"] = user_id
     session["user_name"] = name
@@ -559,6 +1359,29 @@ def dashboard():
     )
 
 
+_AD_HEADLINE_TEMPLATE = "{tone} Growth for {audience} with {product}"
+_AD_BODY_TEMPLATE = (
+    "Use {product} to remove manual work, improve decisions, and scale faster for {audience}. "
+    "Built for teams that want clear ROI and consistent performance."
+)
+_AD_CTA = "Book a 15-minute AI strategy demo"
+_KEYWORD_TEMPLATES = (
+    "best {niche} tools{suffix}",
+    "{niche} pricing comparison{suffix}",
+    "affordable {niche} services{suffix}",
+    "{niche} automation for small business{suffix}",
+    "top-rated {niche} platform{suffix}",
+    "how to choose {niche} software{suffix}",
+)
+_SUPPORT_REPLY_TEMPLATE = (
+    "Hi {customer_name},\n\n"
+    "Thank you for sharing this. I understand how frustrating it can be.\n"
+    "Regarding: \"{issue}\", our team is already checking the root cause.\n"
+    "As a next step, please share your order ID or account email so we can fix this quickly.\n\n"
+    "We appreciate your patience,\nSupport Team"
+)
+
+
 @app.route("/ai/ad-copy", methods=["GET", "POST"])
 @login_required
 def ai_ad_copy():
@@ -570,12 +1393,9 @@ def ai_ad_copy():
 
         if product and audience:
             result = {
-                "headline": f"{tone} Growth for {audience} with {product}",
-                "body": (
-                    f"Use {product} to remove manual work, improve decisions, and scale faster for {audience}. "
-                    f"Built for teams that want clear ROI and consistent performance."
-                ),
-                "cta": "Book a 15-minute AI strategy demo",
+                "headline": _AD_HEADLINE_TEMPLATE.format(tone=tone, audience=audience, product=product),
+                "body": _AD_BODY_TEMPLATE.format(audience=audience, product=product),
+                "cta": _AD_CTA,
             }
 
     return render_template("ai_ad_copy.html", result=result)
@@ -615,14 +1435,7 @@ def ai_keyword_ideas():
 
         if niche:
             suffix = f" in {location}" if location else ""
-            result = [
-                f"best {niche} tools{suffix}",
-                f"{niche} pricing comparison{suffix}",
-                f"affordable {niche} services{suffix}",
-                f"{niche} automation for small business{suffix}",
-                f"top-rated {niche} platform{suffix}",
-                f"how to choose {niche} software{suffix}",
-            ]
+            result = [tpl.format(niche=niche, suffix=suffix) for tpl in _KEYWORD_TEMPLATES]
 
     return render_template("ai_keyword_ideas.html", result=result)
 
@@ -636,20 +1449,15 @@ def ai_support_reply():
         issue = request.form.get("issue", "").strip()
 
         if issue:
-            result = (
-                f"Hi {customer_name},\n\n"
-                "Thank you for sharing this. I understand how frustrating it can be.\n"
-                f"Regarding: \"{issue}\", our team is already checking the root cause.\n"
-                "As a next step, please share your order ID or account email so we can fix this quickly.\n\n"
-                "We appreciate your patience,\nSupport Team"
-            )
+            result = _SUPPORT_REPLY_TEMPLATE.format(customer_name=customer_name, issue=issue)
 
     return render_template("ai_support_reply.html", result=result)
 
 
 @app.route("/ai/exam-prep", methods=["GET", "POST"])
+@limiter.limit(llm_route_limit, methods=["POST"])
 @login_required
-def ai_exam_prep():
+async def ai_exam_prep():
     result = None
     if request.method == "POST":
         subject = request.form.get("subject", "").strip()
@@ -657,13 +1465,7 @@ def ai_exam_prep():
         syllabus = request.form.get("syllabus", "").strip()
 
         if subject and syllabus:
-            raw_topics = [
-                item.strip(" -\t")
-                for line in syllabus.splitlines()
-                for item in line.split(",")
-                if item.strip()
-            ]
-            topics = raw_topics[:12]
+            topics = list(_parse_syllabus(syllabus)[:12])
 
             high_priority = topics[:6] if len(topics) >= 6 else topics
             practice_questions = [
@@ -677,6 +1479,34 @@ def ai_exam_prep():
                 f"Write a short note on {high_priority[-1]} and common exam mistakes."
             ] if high_priority else []
 
+            mini_mock = [
+                "Section A: 5 short-answer questions (2 marks each).",
+                "Section B: 3 medium questions (5 marks each).",
+                "Section C: 1 long-answer question (10 marks).",
+            ]
+
+            llm_system = (
+                "You are an exam preparation assistant. Return one item per line, no numbering. "
+                "Base everything on the given syllabus and do not claim these are guaranteed exam questions."
+            )
+            llm_context = (
+                f"Subject: {subject}\n"
+                f"Exam date: {exam_date or 'Not provided'}\n"
+                f"Syllabus:\n{syllabus}\n"
+            )
+            user_id = session.get("user_id")
+            llm_topics, llm_questions, llm_mock = await asyncio.gather(
+                acall_llm(llm_system, f"{llm_context}List the 6 highest-priority topics.", scope=user_id),
+                acall_llm(llm_system, f"{llm_context}Write 10 exam-style practice questions.", scope=user_id),
+                acall_llm(llm_system, f"{llm_context}Outline a 3-section mini mock test with marks per section.", scope=user_id),
+            )
+            if llm_topics:
+                high_priority = llm_to_list(llm_topics)[:6] or high_priority
+            if llm_questions:
+                practice_questions = llm_to_list(llm_questions) or practice_questions
+            if llm_mock:
+                mini_mock = llm_to_list(llm_mock) or mini_mock
+
             days_left_note = (
                 f"Target exam date: {exam_date}. Prioritize revision and timed practice."
                 if exam_date
@@ -688,11 +1518,7 @@ def ai_exam_prep():
                 "days_left_note": days_left_note,
                 "important_topics": high_priority,
                 "practice_questions": practice_questions[:10],
-                "mini_mock": [
-                    "Section A: 5 short-answer questions (2 marks each).",
-                    "Section B: 3 medium questions (5 marks each).",
-                    "Section C: 1 long-answer question (10 marks).",
-                ],
+                "mini_mock": mini_mock,
                 "note": "These are high-probability practice areas based on your syllabus, not guaranteed exam questions.",
             }
 
@@ -700,8 +1526,9 @@ def ai_exam_prep():
 
 
 @app.route("/ai/tool/<tool_key>", methods=["GET", "POST"])
+@limiter.limit(llm_route_limit, methods=["POST"])
 @login_required
-def ai_generic_tool(tool_key):
+async def ai_generic_tool(tool_key):
     config = AI_TOOL_CONFIG.get(tool_key)
     if not config:
         return redirect(url_for("dashboard"))
@@ -710,7 +1537,9 @@ def ai_generic_tool(tool_key):
     mode = "advanced"
     if request.method == "POST":
         mode = request.form.get("mode", "advanced").strip() or "advanced"
-        result = generate_generic_tool_result(tool_key, request.form, mode=mode)
+        result = await generate_generic_tool_result(
+            tool_key, request.form, mode=mode, user_id=session.get("user_id")
+        )
 
     return render_template(
         "ai_generic_tool.html",
@@ -722,10 +1551,74 @@ def ai_generic_tool(tool_key):
     )
 
 
+@app.route("/ai/tool/<tool_key>/batch", methods=["GET", "POST"])
+@limiter.limit(llm_route_limit, methods=["POST"])
+@login_required
+def ai_generic_tool_batch(tool_key):
+    if tool_key not in AI_TOOL_CONFIG:
+        return {"error": "Unknown tool."}, 404
+
+    if request.method == "GET":
+        with get_db_connection() as conn:
+            rows = conn.execute(
+                "SELECT batch_id, status, ts FROM batch_jobs WHERE user_id = ? AND tool_key = ? "
+                "ORDER BY ts DESC LIMIT 20",
+                (session["user_id"], tool_key),
+            ).fetchall()
+        if any(row["status"] not in _BATCH_TERMINAL_STATUSES for row in rows):
+            start_batch_poller()
+        return {"jobs": [dict(row) for row in rows]}
+
+    payload = request.get_json(silent=True) or {}
+    items = payload.get("items")
+    mode = str(payload.get("mode") or "advanced").strip() or "advanced"
+    if not isinstance(items, list):
+        return {"error": "Provide a list of items."}, 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return {"error": f"A batch can hold at most {BATCH_MAX_ITEMS} items."}, 400
+
+    prompts = [
+        (TOOL_LLM_SYSTEM_PROMPT, tool_llm_prompt(tool_key, {k: str(v) for k, v in item.items()}, mode))
+        for item in items
+        if isinstance(item, dict)
+    ]
+    if not prompts:
+        return {"error": "Provide at least one item with field values."}, 400
+    batch_id = batch_submit(session["user_id"], tool_key, prompts)
+    if not batch_id:
+        return {"error": "Batch submission is not available right now."}, 503
+
+    return {"batch_id": batch_id, "count": len(prompts)}, 202
+
+
+@app.route("/ai/tool/<tool_key>/batch/<batch_id>")
+@login_required
+def ai_generic_tool_batch_results(tool_key, batch_id):
+    with get_db_connection() as conn:
+        job = conn.execute(
+            "SELECT status, ts, prompts, results FROM batch_jobs "
+            "WHERE user_id = ? AND tool_key = ? AND batch_id = ?",
+            (session["user_id"], tool_key, batch_id),
+        ).fetchone()
+    if not job:
+        return {"error": "Unknown batch."}, 404
+
+    if job["status"] not in _BATCH_TERMINAL_STATUSES:
+        start_batch_poller()
+    results = json.loads(job["results"] or "{}")
+    # prompts keeps the submission order, so items line up with the request.
+    items = [
+        {"index": index, "output": llm_to_list(results[custom_id]) if custom_id in results else None}
+        for index, custom_id in enumerate(json.loads(job["prompts"]))
+    ]
+    return {"batch_id": batch_id, "status": job["status"], "ts": job["ts"], "items": items}
+
+
 @app.route("/ai/chat", methods=["GET", "POST"])
+@limiter.limit(llm_route_limit, methods=["POST"])
 @login_required
-def ai_chat():
-    history = session.get("ai_chat_history", [])
+async def ai_chat():
+    history = load_chat_history()
     llm_enabled = bool(os.getenv("OPENAI_API_KEY", "").strip())
 
     if request.method == "POST":
@@ -736,24 +1629,91 @@ def ai_chat():
         message = request.form.get("message", "").strip()
         if message:
             history.append({"role": "user", "content": message})
-            history = history[-16:]
 
-            system_prompt = (
-                "You are a helpful productivity and study assistant. "
-                "Provide practical advice, steps, and concise reasoning. "
-                "Do not claim certainty for uncertain outcomes."
-            )
-            chat_context = "\n".join(
-                [f"{item['role']}: {item['content']}" for item in history[-8:]]
-            )
-            llm_reply = call_llm(system_prompt, chat_context)
-            reply = llm_reply or fallback_chat_reply(message)
+            reply = await find_repeated_chat_reply(history)
+            if not reply:
+                llm_reply = await acall_llm(CHAT_SYSTEM_PROMPT, build_chat_context(history))
+                reply = llm_reply or fallback_chat_reply(message)
             history.append({"role": "assistant", "content": reply})
-            history = history[-16:]
-            session["ai_chat_history"] = history
+            session["ai_chat_history"] = list(history)
 
     return render_template("ai_chat.html", history=history, llm_enabled=llm_enabled)
 
+
+@app.route("/ai/chat/stream", methods=["POST"])
+@limiter.limit(llm_route_limit)
+@login_required
+async def ai_chat_stream():
+    message = request.form.get("message", "").strip()
+    if not message:
+        return {"error": "Message is required."}, 400
+
+    history = load_chat_history()
+    history.append({"role": "user", "content": message})
+    repeated_reply = await find_repeated_chat_reply(history)
+    if repeated_reply:
+        history.append({"role": "assistant", "content": repeated_reply})
+        session["ai_chat_history"] = list(history)
+        return {"reply": repeated_reply}
+
+    stream_id = uuid.uuid4().hex
+    create_chat_stream(stream_id, session["user_id"], message, build_chat_context(history))
+    history.append({"role": "assistant", "content": "", "stream_id": stream_id, "ts": int(time.time())})
+    session["ai_chat_history"] = list(history)
+    return {"stream_url": url_for("ai_chat_stream_events", stream_id=stream_id)}, 201
+
+
+@app.route("/ai/chat/stream/<stream_id>")
+@login_required
+def ai_chat_stream_events(stream_id):
+    job = claim_chat_stream(stream_id, session["user_id"])
+    if not job:
+        # 204 tells EventSource not to reconnect.
+        return Response(status=204)
+    message, chat_context = job["message"], job["prompt"]
+
+    api_key = os.getenv("OPENAI_API_KEY", "").strip()
+    model = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
+    cache_key = None
+    known_reply = None
+    if api_key and LLM_CACHE_ENABLED:
+        cache_key = llm_cache.make_key(model, CHAT_SYSTEM_PROMPT, chat_context)
+        known_reply = llm_cache.get_exact(cache_key)
+
+    def generate():
+        parts = [known_reply] if known_reply else []
+        streamed = False
+        try:
+            if known_reply:
+                yield f"data: {json.dumps({'t': known_reply})}\n\n"
+            elif api_key:
+                stream = _open_chat_stream(get_llm_client(api_key), model, CHAT_SYSTEM_PROMPT, chat_context)
+                for chunk in stream:
+                    delta = (chunk.choices[0].delta.content or "") if chunk.choices else ""
+                    if delta:
+                        parts.append(delta)
+                        yield f"data: {json.dumps({'t': delta})}\n\n"
+                streamed = True
+        except Exception:
+            pass
+        finally:
+            reply = "".join(parts).strip()
+            if not reply:
+                reply = fallback_chat_reply(message)
+            elif streamed and cache_key:
+                llm_cache.set(cache_key, CHAT_SYSTEM_PROMPT, chat_context, None, reply)
+            save_streamed_reply(stream_id, reply)
+
+        if not parts:
+            yield f"data: {json.dumps({'t': reply})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.route("/logout")
 def logout():
     session.clear()
@@ -771,15 +1731,40 @@ def register():
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-                (name, email, password),
-            )
+            if USERS_UPSERT:
+                cursor.execute(
+                    "INSERT INTO users (name, email, password) VALUES (?, ?, ?) "
+                    "ON CONFLICT (email) DO NOTHING RETURNING id",
+                    (name, email, password),
+                )
+                created = cursor.fetchone()
+            else:
+                cursor.execute("SELECT 1 FROM users WHERE email = ? LIMIT 1", (email,))
+                created = None
+                if not cursor.fetchone():
+                    cursor.execute(
+                        "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+                        (name, email, password),
+                    )
+                    created = cursor.lastrowid
             conn.commit()
     except sqlite3.Error as exc:
         return f"Database error: {exc}", 500
 
+    if not created:
+        return "An account with this email already exists.", 409
+
     return redirect(url_for("login", success="Account created. Please login."))
-
+
+# Production entry point: uvicorn app:asgi_app --workers $(( $(nproc) * 2 )) --loop uvloop --http httptools
+asgi_app = WSGIMiddleware(app, workers=ASGI_THREADS)
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=False)
+    import uvicorn
+
+    uvicorn.run(
+        "app:asgi_app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", 5000)),
+        workers=(os.cpu_count() or 1) * 2,
+    )
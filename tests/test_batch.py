@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+import types
+import uuid
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "database.db"))
+os.environ.setdefault("SESSION_COOKIE_SECURE", "0")
+
+import app
+
+
+def _line(custom_id, content, status_code=200):
+    body = {"choices": [{"message": {"content": content}}]}
+    return json.dumps({"custom_id": custom_id, "response": {"status_code": status_code, "body": body}})
+
+
+def _client_for(output):
+    content = lambda file_id: types.SimpleNamespace(text=output)
+    return types.SimpleNamespace(files=types.SimpleNamespace(content=content))
+
+
+def test_store_batch_output_maps_by_custom_id():
+    job = {
+        "prompts": json.dumps({"a": ["s", "u1"], "b": ["s", "u2"], "c": ["s", "u3"], "d": ["s", "u4"]}),
+        "model": "m",
+        "user_id": 1,
+    }
+    output = "\n".join([
+        _line("b", "- two"),
+        "not json",
+        json.dumps({"custom_id": "a", "response": {"status_code": 200, "body": {}}}),
+        _line("c", "- three", status_code=500),
+        _line("unknown", "- stray"),
+        "",
+        _line("d", "- four"),
+    ])
+
+    assert app._store_batch_output(_client_for(output), job, "file") == {"b": "- two", "d": "- four"}
+
+
+def test_results_follow_submission_order():
+    tool_key = next(iter(app.AI_TOOL_CONFIG))
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    prompts = {"first": ["s", "u1"], "second": ["s", "u2"]}
+    with app.get_db_connection() as conn:
+        conn.execute(
+            "INSERT INTO batch_jobs (user_id, tool_key, batch_id, model, prompts, status, ts, results) "
+            "VALUES (1, ?, ?, 'm', ?, 'completed', 0, ?)",
+            (tool_key, batch_id, json.dumps(prompts), json.dumps({"second": "- Alpha\n- Beta"})),
+        )
+        conn.commit()
+
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+    resp = client.get(f"/ai/tool/{tool_key}/batch/{batch_id}")
+    assert resp.get_json()["items"] == [
+        {"index": 0, "output": None},
+        {"index": 1, "output": ["Alpha", "Beta"]},
+    ]
+
+    with client.session_transaction() as sess:
+        sess["user_id"] = 2
+    assert client.get(f"/ai/tool/{tool_key}/batch/{batch_id}").status_code == 404
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import time
+import uuid
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "database.db"))
+
+from flask import session
+
+import app
+
+
+def _placeholder(ts):
+    return {"role": "assistant", "content": "", "stream_id": uuid.uuid4().hex, "ts": ts}
+
+
+def _load(history):
+    with app.app.test_request_context():
+        session["ai_chat_history"] = history
+        session.modified = False
+        loaded = list(app.load_chat_history())
+        return loaded, session.modified, session["ai_chat_history"]
+
+
+def test_finished_stream_replaces_placeholder():
+    pending = _placeholder(int(time.time()))
+    app.create_chat_stream(pending["stream_id"], 1, "hi", "user: hi")
+    app.save_streamed_reply(pending["stream_id"], "hello")
+
+    loaded, modified, stored = _load([{"role": "user", "content": "hi"}, pending])
+
+    assert loaded == [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    assert modified and stored == loaded
+
+
+def test_unfinished_stream_is_kept_without_rewriting_session():
+    pending = _placeholder(int(time.time()))
+    app.create_chat_stream(pending["stream_id"], 1, "hi", "user: hi")
+
+    loaded, modified, _ = _load([{"role": "user", "content": "hi"}, pending])
+
+    assert loaded[-1] == pending
+    assert not modified
+
+
+def test_stale_placeholder_is_dropped():
+    stale = _placeholder(int(time.time()) - app.CHAT_STREAM_PENDING_TTL - 1)
+
+    loaded, modified, stored = _load([{"role": "user", "content": "hi"}, stale])
+
+    assert loaded == [{"role": "user", "content": "hi"}]
+    assert modified and stored == loaded
+
+
+def test_stream_is_claimed_once_by_its_owner():
+    stream_id = uuid.uuid4().hex
+    app.create_chat_stream(stream_id, 1, "hi", "user: hi")
+
+    assert app.claim_chat_stream(stream_id, 2) is None
+    assert tuple(app.claim_chat_stream(stream_id, 1)) == ("hi", "user: hi")
+    assert app.claim_chat_stream(stream_id, 1) is None
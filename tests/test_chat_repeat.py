@@ -0,0 +1,55 @@
+import asyncio
+import os
+import tempfile
+
+import numpy as np
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "database.db"))
+
+import app
+
+
+def _turns(*contents):
+    roles = ("user", "assistant")
+    return [{"role": roles[i % 2], "content": text} for i, text in enumerate(contents)]
+
+
+def _find(monkeypatch, history):
+    calls = []
+
+    async def fake_embed_many(client, texts):
+        calls.append(list(texts))
+        # Every text embeds to the same unit vector, so any candidate is a paraphrase.
+        return np.ones((len(texts), 4), dtype=np.float16) / 2
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(app, "get_async_llm_client", lambda api_key: object())
+    monkeypatch.setattr(app.LLMCache, "embed_many", staticmethod(fake_embed_many))
+    return asyncio.run(app.find_repeated_chat_reply(history)), calls
+
+
+def test_rephrased_question_reuses_reply(monkeypatch):
+    reply, calls = _find(monkeypatch, _turns("what is x", "x is y", "what's x"))
+    assert reply == "x is y"
+    assert calls == [["what's x", "what is x"]]
+
+
+def test_same_previous_question_reuses_reply(monkeypatch):
+    history = _turns("intro", "hello", "what is x", "x is y", "intro", "hello again", "what's x")
+    reply, _ = _find(monkeypatch, history)
+    assert reply == "x is y"
+
+
+def test_different_context_is_not_reused(monkeypatch):
+    history = _turns("about a", "a", "what is it", "it is a", "about b", "b", "what's it")
+    reply, calls = _find(monkeypatch, history)
+    # Only the question asked right before shares the current context.
+    assert reply == "b"
+    assert calls == [["what's it", "about b"]]
+
+
+def test_pending_reply_is_not_reused(monkeypatch):
+    history = _turns("what is x", "", "what's x")
+    reply, calls = _find(monkeypatch, history)
+    assert reply is None
+    assert calls == []
@@ -0,0 +1,31 @@
+import os
+import tempfile
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "database.db"))
+
+from app import llm_to_list
+
+
+def test_strips_bullet_markers():
+    text = "- Alpha\n* Beta\n• Gamma\n\n  -- Delta  \nplain"
+    assert llm_to_list(text) == ["Alpha", "Beta", "Gamma", "Delta", "plain"]
+
+
+def test_keeps_markdown_bold():
+    text = "- **Alpha** one\n**Beta** two"
+    assert llm_to_list(text) == ["**Alpha** one", "**Beta** two"]
+
+
+def test_keeps_content_after_the_marker():
+    assert llm_to_list("- - item") == ["- item"]
+    assert llm_to_list("• • x") == ["• x"]
+    assert llm_to_list("- -10% cost") == ["-10% cost"]
+
+
+def test_skips_marker_only_lines():
+    assert llm_to_list("---\r\nnext\r\n*\n") == ["next"]
+
+
+def test_caps_at_twelve_items():
+    text = "\n".join(f"- item {i}" for i in range(20))
+    assert llm_to_list(text) == [f"item {i}" for i in range(12)]
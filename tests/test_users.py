@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import tempfile
+import uuid
+
+import pytest
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "database.db"))
+os.environ.setdefault("SESSION_COOKIE_SECURE", "0")
+
+import app
+
+
+def _users_conn(indexes):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, email TEXT, password TEXT, google_id TEXT)")
+    if indexes:
+        conn.execute("CREATE UNIQUE INDEX users_email_idx ON users (email)")
+        conn.execute("CREATE UNIQUE INDEX users_google_id_idx ON users (google_id)")
+    return conn
+
+
+def _email():
+    return f"{uuid.uuid4().hex}@example.com"
+
+
+@pytest.fixture
+def client():
+    with app.app.test_client() as client:
+        yield client
+
+
+def test_upsert_links_existing_email(monkeypatch):
+    monkeypatch.setattr(app, "USERS_UPSERT", True)
+    conn = _users_conn(indexes=True)
+    conn.execute("INSERT INTO users (name, email, password) VALUES ('A', 'a@x.com', 'pw')")
+
+    user_id = app.upsert_google_user(conn, "Alice", "a@x.com", "g-1")
+
+    assert user_id == 1
+    assert conn.execute("SELECT name, google_id FROM users").fetchall() == [("Alice", "g-1")]
+
+
+def test_upsert_follows_google_id_to_new_email(monkeypatch):
+    monkeypatch.setattr(app, "USERS_UPSERT", True)
+    conn = _users_conn(indexes=True)
+    first = app.upsert_google_user(conn, "Alice", "a@x.com", "g-1")
+
+    assert app.upsert_google_user(conn, "Alice", "new@x.com", "g-1") == first
+    assert conn.execute("SELECT email FROM users").fetchall() == [("new@x.com",)]
+
+
+def test_upsert_conflicting_accounts_raises(monkeypatch):
+    monkeypatch.setattr(app, "USERS_UPSERT", True)
+    conn = _users_conn(indexes=True)
+    app.upsert_google_user(conn, "Alice", "a@x.com", "g-1")
+    app.upsert_google_user(conn, "Bob", "b@x.com", "g-2")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        app.upsert_google_user(conn, "Alice", "b@x.com", "g-1")
+
+
+def test_fallback_without_indexes_prefers_google_id(monkeypatch):
+    monkeypatch.setattr(app, "USERS_UPSERT", False)
+    conn = _users_conn(indexes=False)
+    conn.executemany(
+        "INSERT INTO users (name, email, password, google_id) VALUES (?, ?, '', ?)",
+        [("Dup", "a@x.com", None), ("Dup", "a@x.com", "g-1")],
+    )
+
+    assert app.upsert_google_user(conn, "Alice", "a@x.com", "g-1") == 2
+    assert app.upsert_google_user(conn, "Carol", "c@x.com", "g-3") == 3
+    assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 3
+
+
+@pytest.mark.parametrize("upsert", [True, False])
+def test_register_rejects_duplicate_email(client, monkeypatch, upsert):
+    monkeypatch.setattr(app, "USERS_UPSERT", upsert)
+    form = {"name": "Dana", "email": _email(), "password": "pw"}
+
+    assert client.post("/register", data=form).status_code == 302
+    assert client.post("/register", data=form).status_code == 409
+
+
+def test_google_callback_conflict_redirects_to_login(client, monkeypatch):
+    class FakeResponse:
+        def __init__(self, payload):
+            self.payload = payload
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return self.payload
+
+    class FakeHTTP:
+        def post(self, url, data):
+            return FakeResponse({"access_token": "token"})
+
+        def get(self, url, headers):
+            return FakeResponse({"sub": "g-1", "email": "taken@example.com", "name": "Eve"})
+
+    def conflict(conn, name, email, google_id):
+        raise sqlite3.IntegrityError("UNIQUE constraint failed: users.email")
+
+    monkeypatch.setattr(app, "_HTTP", FakeHTTP())
+    monkeypatch.setattr(app, "upsert_google_user", conflict)
+    with client.session_transaction() as sess:
+        sess["google_oauth_state"] = "state"
+
+    resp = client.get("/auth/google/callback?state=state&code=abc")
+
+    assert resp.status_code == 302
+    assert "/login" in resp.headers["Location"] and "error=" in resp.headers["Location"]
+    with client.session_transaction() as sess:
+        assert "user_id" not in sess